@@ -1,10 +1,12 @@
 import argparse
 import json
+import multiprocessing
 import os
-from itertools import product
+import subprocess
 from pathlib import Path
-from typing import Any
+from typing import Any, Callable
 
+import matplotlib
 import matplotlib.animation as animation
 import matplotlib.collections as mcoll
 import matplotlib.pyplot as plt
@@ -12,36 +14,90 @@ import numpy as np
 from matplotlib.colors import LinearSegmentedColormap
 
 
+def replay_cluster_sizes(
+    bond_dir: np.ndarray, bond_row: np.ndarray, bond_col: np.ndarray, L: int
+) -> np.ndarray:
+    """Reconstruct per-site cluster sizes for every state from the bonds alone.
+
+    The state sequence is deterministic: state f is the union-find result of
+    applying bonds[:f]. Replaying that here removes the need to persist and
+    read the O(total_states * sites) roots/sizes streams. Instead of parent
+    pointers we keep every site's root fully resolved, so each merge is a
+    vectorized relabel and each frame's sizes are a single gather.
+    """
+    sites = L * L
+    total_states = len(bond_dir) + 1
+
+    site1 = bond_row.astype(np.intp) * L + bond_col
+    site2 = site1 + np.where(bond_dir == 1, 1, L)
+
+    site_root = np.arange(sites)
+    cluster_size = np.ones(sites, dtype=np.uint32)
+    sizes = np.empty((total_states, sites), dtype=np.uint32)
+
+    sizes[0] = 1
+    for frame in range(1, total_states):
+        root_a = site_root[site1[frame - 1]]
+        root_b = site_root[site2[frame - 1]]
+        if root_a != root_b:
+            # Union by size: relabel the smaller cluster
+            if cluster_size[root_a] < cluster_size[root_b]:
+                root_a, root_b = root_b, root_a
+            site_root[site_root == root_b] = root_a
+            cluster_size[root_a] += cluster_size[root_b]
+        sizes[frame] = cluster_size[site_root]
+
+    return sizes
+
+
 def load_percolation() -> (
-    tuple[dict[str, Any], np.ndarray, np.ndarray, np.ndarray, np.ndarray]
+    tuple[
+        dict[str, Any],
+        np.ndarray,
+        tuple[np.ndarray, np.ndarray, np.ndarray],
+        np.ndarray,
+    ]
 ):
     meta = json.load(Path("percolation.json").open("r"))
-    size = meta["size"]
-    sites = size * size
     total_states = meta["total_states"]
     top_n = int(os.getenv("TOP_N", 3))
 
-    # Load roots, sizes, and top sizes
-    roots = np.fromfile("roots.bin", dtype=np.uint32).reshape(total_states, sites)
-    sizes = np.fromfile("sizes.bin", dtype=np.uint32).reshape(total_states, sites)
-    top_sizes = np.fromfile("top_sizes.bin", dtype=np.uint32).reshape(
-        total_states, top_n
+    # Memory-map top sizes so each frame only pages in the row it touches
+    top_sizes = np.memmap(
+        "top_sizes.bin", dtype=np.uint32, mode="r", shape=(total_states, top_n)
     )
 
-    bonds_dtype = np.dtype([("direction", "u1"), ("row", "<u4"), ("col", "<u4")])
-    bonds = np.frombuffer(Path("bonds.bin").read_bytes(), dtype=bonds_dtype)
+    # bonds.bin holds packed 9-byte records; slice it into three contiguous
+    # arrays (SoA) since strided access into unaligned structured records is
+    # much slower than homogeneous arrays
+    raw = np.fromfile("bonds.bin", dtype=np.uint8).reshape(-1, 9)
+    bond_dir = raw[:, 0].copy()
+    bond_row = raw[:, 1:5].copy().view(np.uint32).ravel()
+    bond_col = raw[:, 5:9].copy().view(np.uint32).ravel()
+
+    sizes = replay_cluster_sizes(bond_dir, bond_row, bond_col, meta["size"])
 
-    return meta, roots, sizes, bonds, top_sizes
+    return meta, sizes, (bond_dir, bond_row, bond_col), top_sizes
 
 
-def animate_percolation(save_path=None, interval=50, dpi=100):
-    meta, roots, sizes, bonds, top_sizes = load_percolation()
+FIGSIZE = (16, 8)
+
+
+def build_scene(
+    meta: dict[str, Any],
+    sizes: np.ndarray,
+    bonds: tuple[np.ndarray, np.ndarray, np.ndarray],
+    top_sizes: np.ndarray,
+) -> tuple[plt.Figure, Callable, Callable]:
+    """Build the percolation figure and its init/update animation callbacks."""
+    bond_dir, bond_row, bond_col = bonds
     L = meta["size"]
     p = meta["p"]
+    total_states = meta["total_states"]
     n_top = top_sizes.shape[1]  # Get number of top clusters from data
 
     # Create figure with two subplots side by side
-    fig = plt.figure(figsize=(16, 8), facecolor="white")
+    fig = plt.figure(figsize=FIGSIZE, facecolor="white")
     grid = plt.GridSpec(1, 2, width_ratios=[1, 1], wspace=0.3)
 
     # Grid subplot
@@ -56,16 +112,23 @@ def animate_percolation(save_path=None, interval=50, dpi=100):
     ax_sizes.set_ylabel("Cluster Size")
     ax_sizes.grid(True, alpha=0.3)
 
-    # Setup grid lines
-    grid_lines = np.arange(-0.5, L + 0.5, 1)
-    ax_grid.hlines(
-        grid_lines, -0.5, L - 0.5, color="#e0e0e0", linewidth=0.5, alpha=0.4, zorder=0
-    )
-    ax_grid.vlines(
-        grid_lines, -0.5, L - 0.5, color="#e0e0e0", linewidth=0.5, alpha=0.4, zorder=0
+    # Setup grid lines as one LineCollection (single artist, single draw call)
+    grid_lines = np.arange(-0.5, L + 0.5, 1, dtype=np.float32)
+    grid_segs = np.empty((2 * len(grid_lines), 2, 2), dtype=np.float32)
+    grid_segs[: len(grid_lines), :, 0] = [-0.5, L - 0.5]
+    grid_segs[: len(grid_lines), :, 1] = grid_lines[:, None]
+    grid_segs[len(grid_lines) :, :, 0] = grid_lines[:, None]
+    grid_segs[len(grid_lines) :, :, 1] = [-0.5, L - 0.5]
+    ax_grid.add_collection(
+        mcoll.LineCollection(
+            grid_segs, color="#e0e0e0", linewidth=0.5, alpha=0.4, zorder=0
+        )
     )
 
-    coords = np.array(list(product(range(L), range(L))))
+    # Site i lives at (row, col) = (i // L, i % L) and is drawn at x=col,
+    # y=row, the same convention the bond segments use
+    rr, cc = np.mgrid[0:L, 0:L]
+    coords = np.stack([cc.ravel(), rr.ravel()], axis=1).astype(np.float32)
 
     base_node_size = np.clip(800 / L, 5, 50)
     marker_size = np.clip(15 / L, 0.5, 2)
@@ -75,29 +138,25 @@ def animate_percolation(save_path=None, interval=50, dpi=100):
         static_x, static_y, "o", markersize=marker_size, color="#d0d0d0", alpha=0.3
     )
 
-    horizontal_mask = bonds["direction"] == 1
-    bond_segments = np.empty((len(bonds), 2, 2))
-
-    bond_segments[horizontal_mask] = np.array(
-        [
-            [(c, r), (c + 1, r)]
-            for r, c in zip(
-                bonds["row"][horizontal_mask], bonds["col"][horizontal_mask]
-            )
-        ]
-    )
-    bond_segments[~horizontal_mask] = np.array(
-        [
-            [(c, r), (c, r + 1)]
-            for r, c in zip(
-                bonds["row"][~horizontal_mask], bonds["col"][~horizontal_mask]
-            )
-        ]
-    )
-
+    # Build all bond segments with four vector stores: horizontal bonds extend
+    # by one column, vertical bonds by one row
+    horizontal = bond_dir == 1
+    bond_segments = np.empty((len(bond_dir), 2, 2), dtype=np.float32)
+    bond_segments[:, 0, 0] = bond_col
+    bond_segments[:, 0, 1] = bond_row
+    bond_segments[:, 1, 0] = bond_col + horizontal
+    bond_segments[:, 1, 1] = bond_row + ~horizontal
+
+    # Hand the full segment array to matplotlib once and reveal bonds by
+    # widening their linewidth from 0; set_segments re-validates and re-copies
+    # the whole input every call, while the linewidth buffer is a cheap
+    # per-segment float array
+    bond_linewidth = max(0.25, marker_size / 2)
+    segment_widths = np.zeros(len(bond_dir), dtype=np.float32)
     bond_collection = mcoll.LineCollection(
-        [], color="#1B5299", alpha=0.3, linewidth=max(0.25, marker_size / 2), zorder=1
+        bond_segments, color="#1B5299", alpha=0.3, zorder=1
     )
+    bond_collection.set_linewidths(segment_widths)
     ax_grid.add_collection(bond_collection)
 
     cluster_scatter = ax_grid.scatter(
@@ -114,7 +173,7 @@ def animate_percolation(save_path=None, interval=50, dpi=100):
     )
 
     # Initialize cluster size tracking
-    steps = np.arange(len(roots))
+    steps = np.arange(total_states)
     lines = []
     labels = [f"#{i+1} Largest" for i in range(n_top)]
     colors = plt.cm.Set2(np.linspace(0, 1, n_top))  # Use colormap for n colors
@@ -124,7 +183,7 @@ def animate_percolation(save_path=None, interval=50, dpi=100):
         lines.append(line)
 
     ax_sizes.legend()
-    ax_sizes.set_xlim(0, len(roots))
+    ax_sizes.set_xlim(0, total_states)
 
     max_cluster_size = np.max(top_sizes)
     ax_sizes.set_ylim(0, max_cluster_size * 1.1)
@@ -143,56 +202,80 @@ def animate_percolation(save_path=None, interval=50, dpi=100):
         "cluster_sizes", colors[1:], N=n_bins
     )
     unconnected_color = colors[0]
+    unconnected_rgba = [*plt.matplotlib.colors.to_rgb(unconnected_color), 0.5]
+
+    # The full state sequence is known up front, so compute every frame's
+    # colors and node sizes in one vectorized pass instead of redoing the
+    # colormap/power/mask work inside update() on every draw
+    state_sizes_all = np.asarray(sizes)
+    connected_all = state_sizes_all > 1
+
+    # Per-frame max cluster size; sites with size > 1 exist whenever the max
+    # exceeds 1, so maxing over all sites matches maxing over connected ones.
+    # Everything stays float32: matplotlib accepts float32 RGBA and it halves
+    # the bandwidth of these (total_states, sites) intermediates
+    max_sizes = np.maximum(state_sizes_all.max(axis=1, keepdims=True), 1)
+    size_ratios_all = state_sizes_all.astype(np.float32) / max_sizes.astype(np.float32)
+
+    # Power adjusted for better color distribution
+    colors_per_frame = custom_cmap(np.power(size_ratios_all, 0.7)).astype(
+        np.float32, copy=False
+    )
+    # Scale opacity between 0.5 and 1.0 based on cluster size
+    colors_per_frame[..., 3] = 0.5 + 0.5 * size_ratios_all
+    colors_per_frame[~connected_all] = unconnected_rgba
+
+    node_sizes_per_frame = np.float32(base_node_size) * (
+        0.5 + 0.5 * np.sqrt(size_ratios_all)
+    )
+    node_sizes_per_frame[~connected_all] = base_node_size
+
+    # Persistent per-frame buffers. The scatter's _sizes is bound once and
+    # re-read on every draw, so update() can write sizes in place; facecolors
+    # are re-derived from the last set_facecolors argument during draw, so the
+    # color buffer is rewritten in place and rebound, which still avoids
+    # allocating a fresh array per frame
+    sizes_buf = np.full(L * L, base_node_size, dtype=np.float32)
+    colors_buf = np.full((L * L, 4), unconnected_rgba, dtype=np.float32)
+    cluster_scatter.set_sizes(sizes_buf)
+    cluster_scatter.set_facecolors(colors_buf)
 
     def init():
-        bond_collection.set_segments([])
-        cluster_scatter.set_sizes(np.full(L * L, base_node_size))
-        cluster_scatter.set_facecolors(
-            np.full((L * L, 4), [*plt.matplotlib.colors.to_rgb(unconnected_color), 0.5])
-        )
+        nonlocal current_n_segments, last_frame
+        segment_widths[:] = 0
+        bond_collection.set_linewidths(segment_widths)
+        current_n_segments = 0
+        last_frame = -1
+        sizes_buf[:] = base_node_size
+        colors_buf[:] = unconnected_rgba
+        cluster_scatter.set_facecolors(colors_buf)
         for line in lines:
             line.set_data([], [])
         return [cluster_scatter, step_text, bond_collection] + lines
 
-    def update(frame):
-        state_sizes = sizes[frame]
+    current_n_segments = 0
+    last_frame = -1
 
-        if frame > 0:
-            bond_collection.set_segments(bond_segments[:frame])
-
-        # A site is unconnected if its cluster size is 1
-        unconnected = state_sizes == 1
-        connected_mask = ~unconnected
-
-        # Initialize all colors as unconnected with 0.5 opacity
-        all_colors = np.full(
-            (L * L, 4), [*plt.matplotlib.colors.to_rgb(unconnected_color), 0.5]
-        )
-        node_sizes = np.full(L * L, base_node_size)
-
-        if np.any(connected_mask):
-            # Only compute colors for connected sites
-            max_size = state_sizes[connected_mask].max()
-            size_ratios = state_sizes[connected_mask] / max_size
-
-            # Get base colors from colormap
-            color_scale = np.power(
-                size_ratios, 0.7
-            )  # Adjusted power for better color distribution
-            connected_colors = custom_cmap(color_scale)
-
-            # Scale opacity between 0.5 and 1.0 based on cluster size
-            connected_colors[:, 3] = 0.5 + 0.5 * size_ratios
-
-            all_colors[connected_mask] = connected_colors
-
-            # Adjust sizes for connected sites
-            size_scale = np.power(state_sizes[connected_mask] / max_size, 0.5)
-            node_sizes[connected_mask] *= 0.5 + 0.5 * size_scale
-
-        cluster_scatter.set_offsets(coords)
-        cluster_scatter.set_sizes(node_sizes)
-        cluster_scatter.set_facecolors(all_colors)
+    def update(frame):
+        nonlocal current_n_segments, last_frame
+
+        # Blitting can re-invoke update() on figure events (resize, mouse)
+        # without advancing the frame; skip the full recompute in that case
+        if frame == last_frame:
+            return [cluster_scatter, step_text, bond_collection] + lines
+        last_frame = frame
+
+        # Segments only ever grow by one per frame; reveal newly placed bonds
+        # by setting their linewidth, skipping work when the count is unchanged
+        if frame != current_n_segments:
+            segment_widths[:frame] = bond_linewidth
+            segment_widths[frame:] = 0
+            bond_collection.set_linewidths(segment_widths)
+            current_n_segments = frame
+
+        sizes_buf[:] = node_sizes_per_frame[frame]
+        colors_buf[:] = colors_per_frame[frame]
+        cluster_scatter.set_facecolors(colors_buf)
 
         step_text.set_text(f"Step {frame}, p={p:.2f}")
 
@@ -203,22 +286,113 @@ def animate_percolation(save_path=None, interval=50, dpi=100):
 
         return [cluster_scatter, step_text, bond_collection] + lines
 
+    return fig, init, update
+
+
+_worker_scene = None
+
+
+def _init_render_worker(data, dpi):
+    global _worker_scene
+    matplotlib.use("Agg", force=True)
+    fig, init, update = build_scene(*data)
+    fig.dpi = dpi
+    init()
+    _worker_scene = (fig, update)
+
+
+def _render_frame(frame):
+    fig, update = _worker_scene
+    update(frame)
+    fig.canvas.draw()
+    return fig.canvas.buffer_rgba().tobytes()
+
+
+def save_frames_parallel(data, save_path, interval, dpi, workers):
+    """Render frames in a worker pool and stream them, in order, to ffmpeg.
+
+    Frame rendering is embarrassingly parallel once the per-frame colors and
+    sizes are precomputed: each worker owns a private figure built by
+    build_scene and rasterizes the frames it is handed, while ffmpeg encodes
+    raw RGBA framebuffers from stdin in its own process.
+    """
+    total_states = data[0]["total_states"]
+    width = round(FIGSIZE[0] * dpi)
+    height = round(FIGSIZE[1] * dpi)
+
+    cmd = [
+        "ffmpeg",
+        "-y",
+        "-loglevel",
+        "error",
+        "-f",
+        "rawvideo",
+        "-pix_fmt",
+        "rgba",
+        "-s",
+        f"{width}x{height}",
+        "-r",
+        str(1000 / interval),
+        "-i",
+        "-",
+        "-an",
+        "-c:v",
+        "libx264",
+        "-pix_fmt",
+        "yuv420p",
+        save_path,
+    ]
+    proc = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+    with multiprocessing.Pool(workers, _init_render_worker, (data, dpi)) as pool:
+        for buf in pool.imap(_render_frame, range(total_states), chunksize=4):
+            proc.stdin.write(buf)
+    proc.stdin.close()
+    if proc.wait() != 0:
+        raise RuntimeError(f"ffmpeg exited with status {proc.returncode}")
+
+
+def animate_percolation(save_path=None, interval=50, dpi=100, workers=0):
+    data = load_percolation()
+    total_states = data[0]["total_states"]
+
+    if save_path and workers > 1 and Path(save_path).suffix in (".mp4", ".mkv"):
+        save_frames_parallel(data, save_path, interval, dpi, workers)
+        return None
+
+    fig, init, update = build_scene(*data)
+
+    if save_path:
+        fps = 1000 / interval
+        # ffmpeg encodes frames in a C codec pipeline; Pillow's pure-Python
+        # GIF encoder (256-color, per-frame palette quantization) is kept only
+        # for .gif output
+        if Path(save_path).suffix in (".mp4", ".mkv"):
+            writer = animation.FFMpegWriter(fps=fps, codec="libx264", bitrate=4000)
+        else:
+            writer = animation.PillowWriter(fps=fps)
+
+        # Drive the figure directly: the saving loop needs none of
+        # FuncAnimation's blit caching, event plumbing, or frame iteration
+        # protocol, just update + grab per frame
+        init()
+        with writer.saving(fig, save_path, dpi):
+            for frame in range(total_states):
+                update(frame)
+                writer.grab_frame()
+        plt.close()
+        return None
+
+    # FuncAnimation only drives interactive display
     ani = animation.FuncAnimation(
         fig,
         update,
-        frames=len(roots),
+        frames=total_states,
         init_func=init,
         interval=interval,
         blit=True,
         cache_frame_data=False,
     )
-
-    if save_path:
-        writer = animation.PillowWriter(fps=1000 / interval)
-        ani.save(save_path, writer=writer, dpi=dpi)
-    else:
-        plt.show(block=True)
-
+    plt.show(block=True)
     plt.close()
     return ani
 
@@ -226,12 +400,20 @@ def animate_percolation(save_path=None, interval=50, dpi=100):
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Visualize percolation animation")
     parser.add_argument(
-        "--save", type=str, help="Path to save the animation (e.g. animation.gif)"
+        "--save",
+        type=str,
+        help="Path to save the animation (e.g. animation.mp4 or animation.gif)",
     )
     parser.add_argument(
         "--interval", type=int, default=50, help="Animation interval in milliseconds"
     )
     parser.add_argument("--dpi", type=int, default=100, help="DPI for saved animation")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=0,
+        help="Worker processes for parallel .mp4/.mkv rendering (0 = in-process)",
+    )
 
     args = parser.parse_args()
-    animate_percolation(args.save, args.interval, args.dpi)
+    animate_percolation(args.save, args.interval, args.dpi, args.workers)